@@ -1,8 +1,9 @@
+import functools
 import math
 from typing import List
 
 import numpy as np
-from jinja2 import ChoiceLoader, Environment, PackageLoader
+from jinja2 import ChoiceLoader, Environment, PackageLoader, Template
 
 from scitbx.array_family import flex
 from xfel.clustering.cluster import Cluster
@@ -11,16 +12,20 @@
 from dials.util import tabulate
 
 
-def generate_html_report(plots: dict, filename: str) -> None:
+@functools.lru_cache()
+def _get_report_template() -> Template:
     loader = ChoiceLoader(
         [
             PackageLoader("dials", "templates"),
-            PackageLoader("dials", "static", encoding="utf-8"),
+            PackageLoader("dials", "static"),
         ]
     )
     env = Environment(loader=loader)
-    template = env.get_template("simple_report.html")
-    html = template.render(
+    return env.get_template("simple_report.html")
+
+
+def generate_html_report(plots: dict, filename: str) -> None:
+    html = _get_report_template().render(
         page_title="DIALS SSX indexing report",
         panel_title="Indexing plots",
         graphs=plots,
@@ -40,31 +45,49 @@ def make_summary_table(results_summary: dict) -> tabulate:
         "RMSD dPsi",
     ]
 
-    rows = []
-    total = 0
     if any(len(v) > 1 for v in results_summary.values()):
         show_lattices = True
         overall_summary_header.insert(1, "lattice")
     else:
         show_lattices = False
-    for k in sorted(results_summary.keys()):
-        for j, cryst in enumerate(results_summary[k]):
-            if not cryst["n_indexed"]:
-                continue
-            n_idx, n_strong = (cryst["n_indexed"], cryst["n_strong"])
-            frac_idx = f"{n_idx}/{n_strong} ({100*n_idx/n_strong:2.1f}%)"
-            row = [
-                cryst["Image"],
-                str(total),
-                frac_idx,
-                cryst["RMSD_X"],
-                cryst["RMSD_Y"],
-                cryst["RMSD_dPsi"],
+
+    # (lattice number, summary) for each indexed crystal, in image order
+    indexed = [
+        (j + 1, cryst)
+        for k in sorted(results_summary.keys())
+        for j, cryst in enumerate(results_summary[k])
+        if cryst["n_indexed"]
+    ]
+
+    def _fraction_indexed(cryst):
+        n_idx, n_strong = (cryst["n_indexed"], cryst["n_strong"])
+        return f"{n_idx}/{n_strong} ({100*n_idx/n_strong:2.1f}%)"
+
+    if show_lattices:
+        rows = [
+            [
+                c["Image"],
+                lattice,
+                str(expt_id),
+                _fraction_indexed(c),
+                c["RMSD_X"],
+                c["RMSD_Y"],
+                c["RMSD_dPsi"],
+            ]
+            for expt_id, (lattice, c) in enumerate(indexed)
+        ]
+    else:
+        rows = [
+            [
+                c["Image"],
+                str(expt_id),
+                _fraction_indexed(c),
+                c["RMSD_X"],
+                c["RMSD_Y"],
+                c["RMSD_dPsi"],
             ]
-            if show_lattices:
-                row.insert(1, j + 1)
-            rows.append(row)
-            total += 1
+            for expt_id, (_, c) in enumerate(indexed)
+        ]
 
     summary_table = tabulate(rows, overall_summary_header)
     return summary_table
@@ -76,22 +99,26 @@ def combine_results_dicts(results_summaries: List[dict]) -> dict:
     combined_summary = {}
     n_overall = 0
     for d in results_summaries:
-        n_this = len(d)
-        for i in range(n_this):
-            combined_summary[i + n_overall] = d.pop(i)
-        n_overall += n_this
+        combined_summary.update({i + n_overall: d[i] for i in range(len(d))})
+        n_overall += len(d)
     return combined_summary
 
 
+def _unit_cell_parameters(members: list) -> np.ndarray:
+    """Get an (n, 6) array of the unit cell parameters of the cluster members"""
+    uc_params = np.empty((len(members), 6))
+    for k, member in enumerate(members):
+        uc_params[k] = member.crystal_symmetry.unit_cell().parameters()
+    return uc_params
+
+
 def make_cluster_plots(large_clusters: List[Cluster]) -> dict:
     cluster_plots = {}
     for n, cluster in enumerate(large_clusters):
-        uc_params = [flex.double() for i in range(6)]
-        for c in cluster.members:
-            ucp = c.crystal_symmetry.unit_cell().parameters()
-            for i in range(6):
-                uc_params[i].append(ucp[i])
-        d_this = cluster_plotter.plot_uc_histograms(uc_params)
+        uc_params = _unit_cell_parameters(cluster.members)
+        d_this = cluster_plotter.plot_uc_histograms(
+            [flex.double(uc_params[:, i].copy()) for i in range(6)]
+        )
         d_this["uc_scatter"]["layout"]["title"] += f" cluster {n+1}"
         d_this["uc_hist"]["layout"]["title"] += f" cluster {n+1}"
         d_this[f"uc_scatter_{n}"] = d_this.pop("uc_scatter")
@@ -102,55 +129,57 @@ def make_cluster_plots(large_clusters: List[Cluster]) -> dict:
 
 def generate_plots(summary_data: dict) -> dict:
     """Generate indexing plots from the summary data from index_all_concurrent"""
-    # n_indexed_arrays are cumulative n_indexed for nth lattice
-    n_indexed_arrays = [np.zeros(len(summary_data))]
-    rmsd_x_arrays = [np.zeros(len(summary_data))]
-    rmsd_y_arrays = [np.zeros(len(summary_data))]
-    rmsd_z_arrays = [np.zeros(len(summary_data))]
-    n_total_indexed = np.zeros(len(summary_data))
-    n_strong_array = np.zeros(len(summary_data))
-    images = np.arange(1, len(summary_data) + 1)
-    n_lattices = 1
+    n_images = len(summary_data)
+    n_lattices = max(
+        (len(v) for v in summary_data.values() if any(c["n_indexed"] for c in v)),
+        default=1,
+    )
+    # n_indexed and rmsd arrays have a row for the nth lattice, a column per image
+    n_indexed_arrays = np.zeros((n_lattices, n_images))
+    rmsd_x_arrays = np.zeros((n_lattices, n_images))
+    rmsd_y_arrays = np.zeros((n_lattices, n_images))
+    rmsd_z_arrays = np.zeros((n_lattices, n_images))
+    n_strong_array = np.zeros(n_images)
+    images = np.arange(1, n_images + 1)
+    # plot data must be json serialisable, so convert the image numbers once
+    images_list = images.tolist()
 
-    for k in sorted(summary_data.keys()):
-        n_lattices_this = len(summary_data[k])
-        n_strong_array[k] = summary_data[k][0]["n_strong"]
-        for j, cryst in enumerate(summary_data[k]):
+    # summary_data has keys 0..n_images-1, which index the image columns
+    for k in range(n_images):
+        entries = summary_data[k]
+        n_strong_array[k] = entries[0]["n_strong"]
+        for j, cryst in enumerate(entries):
             if not cryst["n_indexed"]:
                 continue
-            if n_lattices_this > n_lattices:
-                for _ in range(n_lattices_this - n_lattices):
-                    n_indexed_arrays.append(np.zeros(len(summary_data)))
-                    rmsd_x_arrays.append(np.zeros(len(summary_data)))
-                    rmsd_y_arrays.append(np.zeros(len(summary_data)))
-                    rmsd_z_arrays.append(np.zeros(len(summary_data)))
-                n_lattices = n_lattices_this
-            n_indexed_arrays[j][k] = cryst["n_indexed"]
-            rmsd_x_arrays[j][k] = cryst["RMSD_X"]
-            rmsd_y_arrays[j][k] = cryst["RMSD_Y"]
-            rmsd_z_arrays[j][k] = cryst["RMSD_dPsi"]
-            n_total_indexed[k] += cryst["n_indexed"]
+            n_indexed_arrays[j, k] = cryst["n_indexed"]
+            rmsd_x_arrays[j, k] = cryst["RMSD_X"]
+            rmsd_y_arrays[j, k] = cryst["RMSD_Y"]
+            rmsd_z_arrays[j, k] = cryst["RMSD_dPsi"]
+    n_total_indexed = n_indexed_arrays.sum(axis=0)
 
     n_indexed_data = [
         {
-            "x": images.tolist(),
+            "x": images_list,
             "y": n_indexed_arrays[0].tolist(),
             "type": "scatter",
             "mode": "markers",
             "name": "N indexed",
         },
     ]
+    x_mask = rmsd_x_arrays[0] > 0
+    y_mask = rmsd_y_arrays[0] > 0
+    z_mask = rmsd_z_arrays[0] > 0
     rmsd_data = [
         {
-            "x": images[rmsd_x_arrays[0] > 0].tolist(),
-            "y": rmsd_x_arrays[0][rmsd_x_arrays[0] > 0].tolist(),
+            "x": images[x_mask].tolist(),
+            "y": rmsd_x_arrays[0][x_mask].tolist(),
             "type": "scatter",
             "mode": "markers",
             "name": "RMSD X",
         },
         {
-            "x": images[rmsd_y_arrays[0] > 0].tolist(),
-            "y": rmsd_y_arrays[0][rmsd_y_arrays[0] > 0].tolist(),
+            "x": images[y_mask].tolist(),
+            "y": rmsd_y_arrays[0][y_mask].tolist(),
             "type": "scatter",
             "mode": "markers",
             "name": "RMSD Y",
@@ -158,8 +187,8 @@ def generate_plots(summary_data: dict) -> dict:
     ]
     rmsdz_data = [
         {
-            "x": images[rmsd_z_arrays[0] > 0].tolist(),
-            "y": rmsd_z_arrays[0][rmsd_z_arrays[0] > 0].tolist(),
+            "x": images[z_mask].tolist(),
+            "y": rmsd_z_arrays[0][z_mask].tolist(),
             "type": "scatter",
             "mode": "markers",
             "name": "RMSD dPsi",
@@ -171,8 +200,9 @@ def generate_plots(summary_data: dict) -> dict:
         rmsd_data[1]["name"] += " (lattice 1)"
         rmsdz_data[0]["name"] += " (lattice 1)"
         for i, arr in enumerate(n_indexed_arrays[1:]):
-            sub_images = images[arr > 0]
-            sub_data = arr[arr > 0]
+            mask = arr > 0
+            sub_images = images[mask]
+            sub_data = arr[mask]
             n_indexed_data.append(
                 {
                     "x": sub_images.tolist(),
@@ -183,12 +213,13 @@ def generate_plots(summary_data: dict) -> dict:
                 }
             )
         for i, arr in enumerate(rmsd_x_arrays[1:]):
-            sub_images = images[arr > 0]
-            sub_data_x = arr[arr > 0]
-            sub_data_y = rmsd_y_arrays[i + 1][arr > 0]
+            mask = arr > 0
+            sub_images = images[mask].tolist()
+            sub_data_x = arr[mask]
+            sub_data_y = rmsd_y_arrays[i + 1][mask]
             rmsd_data.append(
                 {
-                    "x": sub_images.tolist(),
+                    "x": sub_images,
                     "y": sub_data_x.tolist(),
                     "type": "scatter",
                     "mode": "markers",
@@ -197,7 +228,7 @@ def generate_plots(summary_data: dict) -> dict:
             )
             rmsd_data.append(
                 {
-                    "x": sub_images.tolist(),
+                    "x": sub_images,
                     "y": sub_data_y.tolist(),
                     "type": "scatter",
                     "mode": "markers",
@@ -205,8 +236,9 @@ def generate_plots(summary_data: dict) -> dict:
                 },
             )
         for i, arr in enumerate(rmsd_z_arrays[1:]):
-            sub_images = images[arr > 0]
-            sub_data = arr[arr > 0]
+            mask = arr > 0
+            sub_images = images[mask]
+            sub_data = arr[mask]
             rmsdz_data.append(
                 {
                     "x": sub_images.tolist(),
@@ -217,10 +249,9 @@ def generate_plots(summary_data: dict) -> dict:
                 },
             )
     percent_indexed = 100 * n_total_indexed / n_strong_array
-    images = images.tolist()
     n_indexed_data.append(
         {
-            "x": images,
+            "x": images_list,
             "y": n_strong_array.tolist(),
             "type": "scatter",
             "mode": "markers",
@@ -229,20 +260,28 @@ def generate_plots(summary_data: dict) -> dict:
     )
 
     percent_bins = np.linspace(0, 100, 51)
-    percent_hist = np.histogram(percent_indexed, percent_bins)[0]
+    # The bins are a uniform 2% wide, so just count the bin indices, with 100%
+    # going in the last bin to match np.histogram
+    in_range = percent_indexed[(percent_indexed >= 0) & (percent_indexed <= 100)]
+    percent_hist = np.bincount(
+        np.minimum((in_range // 2).astype(int), 49), minlength=50
+    )
 
     def _generate_hist_data(rmsd_arrays, step=0.01):
-        all_rmsd = np.concatenate(rmsd_arrays)
-        all_rmsd = all_rmsd[all_rmsd > 0]
+        positive_rmsds = [arr[arr > 0] for arr in rmsd_arrays]
+        if not any(arr.size for arr in positive_rmsds):
+            return np.zeros(0, dtype=int), np.zeros(0)
         mult = int(1 / 0.01)
-        start = math.floor(np.min(all_rmsd) * mult) / mult
-        stop = math.ceil(np.max(all_rmsd) * mult) / mult
+        start = min(np.min(arr) for arr in positive_rmsds if arr.size)
+        stop = max(np.max(arr) for arr in positive_rmsds if arr.size)
+        start = math.floor(start * mult) / mult
+        stop = math.ceil(stop * mult) / mult
         nbins = int((stop - start) / step)
-        hist, bin_edges = np.histogram(
-            all_rmsd,
-            bins=nbins,
-            range=(start, stop),
-        )
+        # histogram each array into the same bins, rather than concatenating
+        hist = np.zeros(nbins, dtype=int)
+        for arr in positive_rmsds:
+            counts, bin_edges = np.histogram(arr, bins=nbins, range=(start, stop))
+            hist += counts
         bin_centers = bin_edges[:-1] + np.diff(bin_edges) / 2
         return hist, bin_centers
 
@@ -262,7 +301,7 @@ def _generate_hist_data(rmsd_arrays, step=0.01):
         "percent_indexed": {
             "data": [
                 {
-                    "x": images,
+                    "x": images_list,
                     "y": percent_indexed.tolist(),
                     "type": "scatter",
                     "mode": "markers",
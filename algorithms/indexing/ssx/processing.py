@@ -257,9 +257,8 @@ def index(
         combine = CombineWithReference(
             detector=indexed_experiments[0].detector, beam=indexed_experiments[0].beam
         )
-        elist = ExperimentList()
-        for expt in indexed_experiments:
-            elist.append(combine(expt))
-        indexed_experiments = elist
+        indexed_experiments = ExperimentList(
+            [combine(expt) for expt in indexed_experiments]
+        )
 
     return indexed_experiments, indexed_reflections, results_summary
@@ -2,8 +2,9 @@
 import math
 import pickle
 
+import numpy as np
+
 from iotbx import phil
-from scitbx import matrix
 
 from dials.array_family import flex
 from dials.util import Sorry, log, show_mail_handle_errors
@@ -97,9 +98,9 @@ def make_dx_dy_translate(imageset, dx, dy):
 
 
 def ellipse_matrix_form(phi, l1, l2):
-    """Return the matrix for the quadratic form describing the oblique ellipse
-    where the first axis makes an angle phi with the X axis and the scale factors
-    for the axes are l1 and l2.
+    """Return the elements (a11, a12, a22) of the symmetric matrix for the
+    quadratic form describing the oblique ellipse where the first axis makes an
+    angle phi with the X axis and the scale factors for the axes are l1 and l2.
     See https://www.le.ac.uk/users/dsgp1/COURSES/TOPICS/quadrat.pdf"""
     deg2rad = math.pi / 180.0
     phi *= deg2rad
@@ -108,12 +109,17 @@ def ellipse_matrix_form(phi, l1, l2):
 
     a11 = l1 * cphi ** 2 + l2 * sphi ** 2
     a12 = (l2 - l1) * sphi * cphi
-    a21 = a12
     a22 = l1 * sphi ** 2 + l2 * cphi ** 2
 
-    assert a11 * a22 - 2 * a12 > 0.0
+    # The eigenvalues of the matrix are l1 and l2, so it is positive definite
+    # only if both are positive
+    if l1 <= 0.0 or l2 <= 0.0:
+        raise Sorry(
+            "The ellipse matrix is not positive definite. Please check that the "
+            "scale factors l1 and l2 are both positive"
+        )
 
-    return matrix.sqr((a11, a12, a21, a22))
+    return a11, a12, a22
 
 
 def make_dx_dy_ellipse(imageset, phi, l1, l2, centre_xy):
@@ -122,14 +128,14 @@ def make_dx_dy_ellipse(imageset, phi, l1, l2, centre_xy):
     # Get fast and slow axes from the first panel. These will form the X and Y
     # directions for the Cartesian coordinates of the correction map
     p0 = detector[0]
-    f0, s0 = matrix.col(p0.get_fast_axis()), matrix.col(p0.get_slow_axis())
+    f0, s0 = np.array(p0.get_fast_axis()), np.array(p0.get_slow_axis())
 
     # Get the lab coordinate of the centre of the ellipse
-    topleft = matrix.col(p0.get_pixel_lab_coord((0, 0)))
+    topleft = np.array(p0.get_pixel_lab_coord((0, 0)))
     mid = topleft + centre_xy[0] * f0 + centre_xy[1] * s0
 
-    # Get matrix describing the elliptical distortion
-    M = ellipse_matrix_form(phi, l1, l2)
+    # Get elements of the symmetric matrix describing the elliptical distortion
+    a11, a12, a22 = ellipse_matrix_form(phi, l1, l2)
 
     distortion_map_x = []
     distortion_map_y = []
@@ -137,27 +143,30 @@ def make_dx_dy_ellipse(imageset, phi, l1, l2, centre_xy):
     for panel in detector:
         size_x, size_y = panel.get_pixel_size()
         nx, ny = panel.get_image_size()
-        dx = flex.double(flex.grid(nx, ny), 0.0)
-        dy = flex.double(flex.grid(nx, ny), 0.0)
-        elt = 0
-        for j in range(ny):
-            for i in range(nx):
-                # Get the X,Y coordinate of this pixel in the frame of the correction
-                # map, which has its origin at the centre of the ellipse and is aligned
-                # along fast, slow of the first panel.
-                lab = matrix.col(panel.get_pixel_lab_coord((i + 0.5, j + 0.5)))
-                offset = lab - mid
-                x = offset.dot(f0)  # undistorted X coordinate (mm)
-                y = offset.dot(s0)  # undistorted Y coordinate (mm)
-                distort = M * matrix.col((x, y))  # distorted by ellipse matrix
-
-                # store correction in units of the pixel size
-                dx[elt] = (x - distort[0]) / size_x
-                dy[elt] = (y - distort[1]) / size_y
-                elt += 1
+
+        # Get the lab coordinates of all pixel centres on this panel in one call,
+        # going through the panel's pixel to millimetre strategy so that any
+        # parallax correction is included
+        px, py = np.meshgrid(np.arange(nx) + 0.5, np.arange(ny) + 0.5)
+        xy_mm = panel.pixel_to_millimeter(
+            flex.vec2_double(flex.double(px.ravel()), flex.double(py.ravel()))
+        )
+        lab = panel.get_lab_coord(xy_mm).as_double().as_numpy_array()
+
+        # Get the X,Y coordinates of these pixels in the frame of the correction
+        # map, which has its origin at the centre of the ellipse and is aligned
+        # along fast, slow of the first panel.
+        offset = lab.reshape(ny, nx, 3) - mid
+        x = offset @ f0  # undistorted X coordinates (mm)
+        y = offset @ s0  # undistorted Y coordinates (mm)
+
+        # store correction in units of the pixel size
+        dx = (x - (a11 * x + a12 * y)) / size_x
+        dy = (y - (a12 * x + a22 * y)) / size_y
+
         # Add results for this panel
-        distortion_map_x.append(dx)
-        distortion_map_y.append(dy)
+        distortion_map_x.append(flex.double(np.ascontiguousarray(dx)))
+        distortion_map_y.append(flex.double(np.ascontiguousarray(dy)))
 
     distortion_map_x = tuple(distortion_map_x)
     distortion_map_y = tuple(distortion_map_y)
@@ -106,7 +106,7 @@ def run(args: List[str] = None, phil: phil.scope = phil_scope) -> None:
         usage="dev.dials.ssx_index imported.expt strong.refl [options]",
         read_experiments=True,
         read_reflections=True,
-        phil=phil_scope,
+        phil=phil,
         check_format=False,
         epilog=__doc__,
     )
@@ -182,7 +182,7 @@ def run(args: List[str] = None, phil: phil.scope = phil_scope) -> None:
             generate_html_report(summary_plots, params.output.html)
         if params.output.json:
             with open(params.output.json, "w") as outfile:
-                json.dump(summary_plots, outfile)
+                json.dump(summary_plots, outfile, separators=(",", ":"))
 
     logger.info(f"Total time: {time.time() - st:.2f}s")
 
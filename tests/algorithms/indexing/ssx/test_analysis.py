@@ -81,6 +81,8 @@ def test_combine_multiple_results_summary_dicts():
             assert len(res) == 2
         else:
             assert len(res) == 1
+    # the input dictionaries should not be modified
+    assert list(s1.keys()) == list(s2.keys()) == [0, 1, 2]
 
 
 @pytest.mark.parametrize("n_lattices", [1, 2])
@@ -127,6 +129,17 @@ def test_generate_plots(n_lattices):
     assert sum(plots["rmsdz_hist"]["data"][0]["y"]) == n_lattices + 1
 
 
+def test_generate_plots_none_indexed():
+    results = generate_test_results_dict()
+    del results[1], results[2]
+    plots = generate_plots(results)
+    assert plots["n_indexed"]["data"][0]["y"] == [0.0]
+    assert plots["percent_indexed"]["data"][0]["y"] == [0.0]
+    assert plots["rmsds"]["data"][0]["y"] == []
+    assert plots["rmsdxy_hist"]["data"][0]["y"] == []
+    assert plots["rmsdz_hist"]["data"][0]["y"] == []
+
+
 def test_generate_html_report(run_in_tmpdir):
     plots = generate_plots(generate_test_results_dict())
     fname = "test_report_name.html"
@@ -1,50 +1,34 @@
-import procrunner
+import itertools
 
+from dials.command_line import dials_import, export_best, find_spots, index, integrate
 
-def test_export_best(dials_data, tmpdir):
-    result = procrunner.run(
+
+def test_export_best(dials_data, run_in_tmpdir):
+    dials_import.run(
         [
-            "dials.import",
             "template="
             + dials_data("centroid_test_data").join("centroid_####.cbf").strpath,
-        ],
-        working_directory=tmpdir.strpath,
-    )
-    assert not result.returncode and not result.stderr
-    result = procrunner.run(
-        ["dials.find_spots", "imported.expt", "nproc=1"],
-        working_directory=tmpdir.strpath,
+        ]
     )
-    assert not result.returncode and not result.stderr
-    result = procrunner.run(
-        ["dials.index", "imported.expt", "strong.refl", "space_group=P422"],
-        working_directory=tmpdir.strpath,
-    )
-    assert not result.returncode and not result.stderr
-    result = procrunner.run(
+    find_spots.run(["imported.expt", "nproc=1"])
+    index.run(["imported.expt", "strong.refl", "space_group=P422"])
+    integrate.run(
         [
-            "dials.integrate",
             "nproc=1",
             "indexed.expt",
             "indexed.refl",
             "prediction.padding=0",
             "sigma_m_algorithm=basic",
-        ],
-        working_directory=tmpdir.strpath,
-    )
-    assert not result.returncode and not result.stderr
-    result = procrunner.run(
-        ["dials.export_best", "integrated.expt", "integrated.refl"],
-        working_directory=tmpdir.strpath,
+        ]
     )
-    assert not result.returncode and not result.stderr
+    export_best.run(["integrated.expt", "integrated.refl"])
 
-    assert tmpdir.join("best.dat").check()
-    assert tmpdir.join("best.hkl").check()
-    assert tmpdir.join("best.par").check()
+    assert run_in_tmpdir.join("best.dat").check()
+    assert run_in_tmpdir.join("best.hkl").check()
+    assert run_in_tmpdir.join("best.par").check()
 
-    with tmpdir.join("best.dat").open("r") as f:
-        lines = "".join(f.readlines()[:10])
+    with run_in_tmpdir.join("best.dat").open("r") as f:
+        lines = "".join(itertools.islice(f, 10))
     assert (
         lines
         == """\
@@ -61,8 +45,8 @@ def test_export_best(dials_data, tmpdir):
 """
     )
 
-    with tmpdir.join("best.hkl").open("r") as f:
-        lines = "".join(f.readlines()[:10])
+    with run_in_tmpdir.join("best.hkl").open("r") as f:
+        lines = "".join(itertools.islice(f, 10))
     assert (
         lines
         == """\
@@ -79,7 +63,7 @@ def test_export_best(dials_data, tmpdir):
 """
     )
 
-    lines = tmpdir.join("best.par").read()
+    lines = run_in_tmpdir.join("best.par").read()
     assert (
         lines
         == """\
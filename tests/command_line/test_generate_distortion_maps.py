@@ -5,20 +5,25 @@
 
 from dxtbx.format.Format import Reader
 from dxtbx.imageset import ImageSet, ImageSetData
+from dxtbx.model import ParallaxCorrectedPxMmStrategy
 from dxtbx.model.beam import Beam
 from dxtbx.model.detector import Detector
 from dxtbx.model.experiment_list import ExperimentListFactory
 from libtbx import easy_run
 from scitbx import matrix
 
+from dials.command_line.generate_distortion_maps import (
+    ellipse_matrix_form,
+    make_dx_dy_ellipse,
+)
+from dials.util import Sorry
 
-def make_detector():
+
+def make_detector(npixels_per_panel_x=50, npixels_per_panel_y=50):
     """Make a dummy 4 panel detector with not many pixels to ensure test runs
     quickly"""
     pixel_size_x = 0.1
     pixel_size_y = 0.1
-    npixels_per_panel_x = 50
-    npixels_per_panel_y = 50
     distance = 100
     fast = matrix.col((1, 0, 0))
     slow = matrix.col((0, -1, 0))
@@ -49,6 +54,16 @@ def make_detector():
     return d
 
 
+def test_ellipse_matrix_form():
+    a11, a12, a22 = ellipse_matrix_form(phi=30.0, l1=1.0, l2=0.95)
+    assert a11 * a22 - a12 * a12 == pytest.approx(0.95)
+    with pytest.raises(Sorry):
+        ellipse_matrix_form(phi=30.0, l1=1.0, l2=-0.95)
+    # both negative gives a positive determinant, but is negative definite
+    with pytest.raises(Sorry):
+        ellipse_matrix_form(phi=30.0, l1=-1.0, l2=-1.0)
+
+
 def test_translate(dials_regression, run_in_tmpdir):
     """Test as written in https://github.com/dials/dials/issues/471. This
     is pretty slow!"""
@@ -183,3 +198,52 @@ def test_elliptical_distortion(run_in_tmpdir):
     col0 = dy[2].matrix_copy_column(0)
     for i in range(1, 50):
         assert (col0 == dy[2].matrix_copy_column(i)).all_eq(True)
+
+
+def test_elliptical_distortion_non_square_panels():
+    """Check the maps for non-square panels have the (slow, fast) shape of the
+    panel image data"""
+    d = make_detector(npixels_per_panel_x=40, npixels_per_panel_y=30)
+    imageset = ImageSet(ImageSetData(Reader(None, ["non-existent.cbf"]), None))
+    imageset.set_detector(d)
+
+    dx, dy = make_dx_dy_ellipse(
+        imageset, phi=0.0, l1=1.0, l2=0.95, centre_xy=d[0].get_image_size_mm()
+    )
+
+    assert len(dx) == len(dy) == 4
+    for k, panel in enumerate(d):
+        image_size = panel.get_image_size()
+        assert dx[k].focus() == dy[k].focus() == image_size[::-1]
+
+
+def test_elliptical_distortion_parallax_corrected_panels():
+    """Check the maps for panels with a parallax corrected pixel to millimetre
+    strategy against a direct calculation for individual pixels"""
+    d = make_detector()
+    for panel in d:
+        panel.set_px_mm_strategy(ParallaxCorrectedPxMmStrategy(3.96, 0.32))
+    imageset = ImageSet(ImageSetData(Reader(None, ["non-existent.cbf"]), None))
+    imageset.set_detector(d)
+
+    phi, l1, l2 = 30.0, 1.0, 0.95
+    centre_xy = d[0].get_image_size_mm()
+    dx, dy = make_dx_dy_ellipse(imageset, phi, l1, l2, centre_xy)
+
+    a11, a12, a22 = ellipse_matrix_form(phi, l1, l2)
+    M = matrix.sqr((a11, a12, a12, a22))
+    f0 = matrix.col(d[0].get_fast_axis())
+    s0 = matrix.col(d[0].get_slow_axis())
+    mid = (
+        matrix.col(d[0].get_pixel_lab_coord((0, 0)))
+        + centre_xy[0] * f0
+        + centre_xy[1] * s0
+    )
+    for k, i, j in ((0, 0, 0), (1, 49, 7), (3, 12, 37)):
+        panel = d[k]
+        offset = matrix.col(panel.get_pixel_lab_coord((i + 0.5, j + 0.5))) - mid
+        x, y = offset.dot(f0), offset.dot(s0)
+        distort = M * matrix.col((x, y))
+        size_x, size_y = panel.get_pixel_size()
+        assert dx[k][j, i] == pytest.approx((x - distort[0]) / size_x)
+        assert dy[k][j, i] == pytest.approx((y - distort[1]) / size_y)